@@ -1,24 +1,35 @@
-import os, json, time
+import asyncio
+import os, threading, time
+from collections import deque
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from pathlib import Path
 
 import boto3
-from fastapi import FastAPI, HTTPException, Request
+import orjson
+from cachetools import TTLCache
+from dotenv import dotenv_values
+
+# aioboto3 enables concurrent S3 GETs; fall back to the sync client on
+# legacy deployments where it is not installed
+try:
+    import aioboto3
+except ImportError:
+    aioboto3 = None
+from fastapi import FastAPI, HTTPException, Query, Request
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
-from starlette.responses import Response
+from starlette.responses import Response, StreamingResponse
 
 # Load environment from vault-agent generated .env file
 def load_env_file(env_file_path: str = "/app/.env"):
     """Load environment variables from vault-agent generated .env file"""
     env_path = Path(env_file_path)
     if env_path.exists():
-        with open(env_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#'):
-                    key, _, value = line.partition('=')
-                    if key and value:
-                        os.environ.setdefault(key.strip(), value.strip())
+        for key, value in dotenv_values(env_path).items():
+            if value:
+                os.environ.setdefault(key, value)
 
 # Check for custom ENV_FILE location
 env_file = os.getenv("ENV_FILE", "/app/.env")
@@ -41,8 +52,27 @@ def read_secret(env_var_name: str, default: str = None) -> str:
         raise RuntimeError(f"{env_var_name} not set (checked env var and {env_var_name}_FILE)")
     return value
 
-app = FastAPI()
-s3 = boto3.client("s3")
+# Shared connection-pool tuning: the default pool of 10 would serialise
+# the concurrent GETs in /products, and adaptive retries back off instead
+# of storming on throttling
+_S3_CONFIG = Config(
+    max_pool_connections=64,
+    retries={"max_attempts": 3, "mode": "adaptive"},
+    tcp_keepalive=True,
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open one shared aioboto3 S3 client for the lifetime of the app"""
+    if aioboto3 is not None:
+        async with aioboto3.Session().client("s3", config=_S3_CONFIG) as client:
+            app.state.s3 = client
+            yield
+    else:
+        yield
+
+app = FastAPI(lifespan=lifespan)
+s3 = boto3.session.Session().client("s3", config=_S3_CONFIG)
 BUCKET = read_secret("WEATHER_RESULTS_BUCKET", "dagster-weather-products")
 PREFIX = os.getenv("WEATHER_RESULTS_PREFIX", "weather-products/")
 
@@ -68,72 +98,184 @@ api_up = Gauge(
 # Set API as up on startup
 api_up.set(1)
 
+# .labels() does a dict lookup and tuple construction on every call; cache
+# the bound children so the hot request path just calls .inc()/.observe()
+@lru_cache(maxsize=1024)
+def _request_counter(method: str, endpoint: str, status: str):
+    return http_requests_total.labels(method=method, endpoint=endpoint, status=status)
+
+@lru_cache(maxsize=1024)
+def _request_duration(method: str, endpoint: str):
+    return http_request_duration_seconds.labels(method=method, endpoint=endpoint)
+
+# Allowlist of endpoint label values; raw request paths are unbounded and
+# would create a new time series per unique URL
+_KNOWN_ENDPOINTS = {"/products", "/health", "/metrics"}
+
+def _endpoint_label(request: Request) -> str:
+    """Return the templated route path, capped to the known endpoint set"""
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    return path if path in _KNOWN_ENDPOINTS else "other"
+
+# Probe and scrape traffic skips instrumentation entirely: kubelet hits
+# /health every few seconds and Prometheus hits /metrics once per scrape,
+# and self-observing those adds label lookups and histogram updates on
+# the liveness critical path
+_UNINSTRUMENTED_PATHS = {"/health", "/metrics"}
+
 @app.middleware("http")
 async def prometheus_middleware(request: Request, call_next):
     """Middleware to track request metrics"""
+    if request.url.path in _UNINSTRUMENTED_PATHS:
+        return await call_next(request)
+
     start_time = time.time()
 
-    # Get endpoint path
-    endpoint = request.url.path
     method = request.method
 
     try:
         response = await call_next(request)
         status_code = response.status_code
 
+        # Route matching happens inside call_next, so the endpoint label is
+        # resolved afterwards
+        endpoint = _endpoint_label(request)
+
         # Record metrics
-        http_requests_total.labels(
-            method=method,
-            endpoint=endpoint,
-            status=str(status_code)
-        ).inc()
+        _request_counter(method, endpoint, str(status_code)).inc()
 
         duration = time.time() - start_time
-        http_request_duration_seconds.labels(
-            method=method,
-            endpoint=endpoint
-        ).observe(duration)
+        _request_duration(method, endpoint).observe(duration)
 
         return response
     except Exception as e:
         # Record error
-        http_requests_total.labels(
-            method=method,
-            endpoint=endpoint,
-            status="500"
-        ).inc()
+        endpoint = _endpoint_label(request)
+        _request_counter(method, endpoint, "500").inc()
 
         duration = time.time() - start_time
-        http_request_duration_seconds.labels(
-            method=method,
-            endpoint=endpoint
-        ).observe(duration)
+        _request_duration(method, endpoint).observe(duration)
 
         raise e
 
 @app.get("/health")
-def health():
+async def health():
     """Health check endpoint for Kubernetes probes"""
     return {"status": "healthy", "service": "products-api"}
 
 @app.get("/metrics")
-def metrics():
+async def metrics():
     """Prometheus metrics endpoint"""
     return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
-@app.get("/products")
-def list_products(limit: int = 1):
+# Cache recent key listings so repeated scrapes within the TTL skip the
+# ListObjectsV2 round-trips entirely; cachetools caches are not
+# thread-safe and this one is hit from to_thread/threadpool workers, so
+# access goes through the lock
+_key_cache = TTLCache(maxsize=8, ttl=30)
+_key_cache_lock = threading.Lock()
+
+def _list_recent_keys(limit: int) -> list:
+    """
+    Return the last `limit` .jsonl keys under PREFIX, oldest first.
+
+    Keys are date-formatted (YYYY/MM/DD/HHMMSS.jsonl) so ListObjectsV2's
+    lexicographic ordering is already chronological; a bounded deque over
+    the paginated listing keeps only the newest `limit` without sorting.
+    """
+    cache_key = (BUCKET, PREFIX, limit)
+    with _key_cache_lock:
+        keys = _key_cache.get(cache_key)
+    if keys is None:
+        # The listing itself runs outside the lock so a slow S3 call
+        # doesn't serialise unrelated cache hits
+        recent = deque(maxlen=limit)
+        paginator = s3.get_paginator("list_objects_v2")
+        pages = paginator.paginate(Bucket=BUCKET, Prefix=PREFIX, PaginationConfig={"PageSize": 1000})
+        for page in pages:
+            for obj in page.get("Contents", []):
+                if obj["Key"].endswith(".jsonl"):
+                    recent.append(obj["Key"])
+        keys = list(recent)
+        with _key_cache_lock:
+            _key_cache[cache_key] = keys
+    return keys
+
+async def _stream_jsonl(s3a, key: str) -> list:
+    """
+    Stream one JSONL object, parsing records as chunks arrive.
+
+    iter_lines keeps peak memory at O(chunk) instead of O(file); each
+    yielded line is raw bytes fed straight to orjson.loads.
+    """
+    resp = await s3a.get_object(Bucket=BUCKET, Key=key)
+    items = []
+    async for line in resp["Body"].iter_lines(chunk_size=65536):
+        if line:
+            items.append(orjson.loads(line))
+    return items
+
+# Above this many objects, stream the response instead of materialising
+# every record: our pipeline writes one JSON document per JSONL line, so
+# lines are forwarded into the output array verbatim with no parse or
+# re-serialise pass
+_STREAM_THRESHOLD = 10
+
+async def _stream_products(s3a, keys: list, first_resp):
+    """Yield the records of the given keys as one JSON array, in key order"""
+    yield b"["
+    sep = b""
     try:
-        resp = s3.list_objects_v2(Bucket=BUCKET, Prefix=PREFIX)
-        keys = sorted([o["Key"] for o in resp.get("Contents", []) if o["Key"].endswith(".jsonl")])
-        if not keys: return []
-        keys = keys[-limit:]
-        items = []
-        for k in keys:
-            body = s3.get_object(Bucket=BUCKET, Key=k)["Body"].read().decode("utf-8")
-            for line in body.splitlines():
-                if line.strip():
-                    items.append(json.loads(line))
-        return items
-    except ClientError as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        for i, k in enumerate(keys):
+            resp = first_resp if i == 0 else await s3a.get_object(Bucket=BUCKET, Key=k)
+            async for line in resp["Body"].iter_lines(chunk_size=65536):
+                if line:
+                    yield sep + line
+                    sep = b","
+    except ClientError:
+        # The 200 status line is already on the wire, so a mid-stream
+        # failure can only close the array early; lines are yielded whole,
+        # so the truncated document is still valid JSON
+        pass
+    yield b"]"
+
+if aioboto3 is not None:
+    @app.get("/products")
+    async def list_products(request: Request, limit: int = Query(1, ge=0)):
+        try:
+            # Listing uses the sync client (and its TTL cache), so keep it
+            # off the event loop
+            keys = await asyncio.to_thread(_list_recent_keys, limit)
+            if not keys: return []
+            s3a = request.app.state.s3
+            if limit > _STREAM_THRESHOLD:
+                # First bytes go out after the first GET instead of after
+                # all of them, and peak memory stays at one chunk. The
+                # first GET is issued here, before the response exists, so
+                # a stale cached key still surfaces as a 500 instead of a
+                # 200 with a truncated body
+                first_resp = await s3a.get_object(Bucket=BUCKET, Key=keys[0])
+                return StreamingResponse(_stream_products(s3a, keys, first_resp), media_type="application/json")
+            chunks = await asyncio.gather(*[_stream_jsonl(s3a, k) for k in keys])
+            items = []
+            for chunk in chunks:
+                items.extend(chunk)
+            return items
+        except ClientError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+else:
+    @app.get("/products")
+    def list_products(limit: int = Query(1, ge=0)):
+        try:
+            keys = _list_recent_keys(limit)
+            if not keys: return []
+            items = []
+            for k in keys:
+                body = s3.get_object(Bucket=BUCKET, Key=k)["Body"]
+                for line in body.iter_lines(chunk_size=65536):
+                    if line:
+                        items.append(orjson.loads(line))
+            return items
+        except ClientError as e:
+            raise HTTPException(status_code=500, detail=str(e))
@@ -7,8 +7,10 @@ Optionally pushes metrics to Pushgateway for persistence after job completion.
 """
 
 import os
+import queue
 import threading
 import time
+from cachetools import TTLCache
 from prometheus_client import Counter, Gauge, Histogram, start_http_server, REGISTRY, push_to_gateway
 from dagster import get_dagster_logger, success_hook, failure_hook, HookContext
 
@@ -74,8 +76,10 @@ dagster_daemon_heartbeat = Gauge(
     'Dagster daemon heartbeat (1=alive, 0=dead)'
 )
 
-# Set daemon heartbeat to 1 on module load
-dagster_daemon_heartbeat.set(1)
+# Evaluate the heartbeat at scrape time: the value is 1 whenever the
+# process (and therefore the metrics server) is alive, with no background
+# thread needed to keep it fresh
+dagster_daemon_heartbeat.set_function(lambda: 1)
 
 
 class MetricsServer:
@@ -83,22 +87,17 @@ class MetricsServer:
 
     def __init__(self, port=9090):
         self.port = port
-        self.server_thread = None
         self._started = False
 
     def start(self):
-        """Start the metrics HTTP server in a background thread."""
+        """Start the metrics HTTP server."""
         if self._started:
             return
 
         try:
-            # Start HTTP server in daemon thread
-            self.server_thread = threading.Thread(
-                target=self._run_server,
-                daemon=True,
-                name="PrometheusMetricsServer"
-            )
-            self.server_thread.start()
+            # start_http_server spawns its own daemon serving thread and
+            # returns immediately
+            start_http_server(self.port)
             self._started = True
 
             log = get_dagster_logger()
@@ -107,19 +106,6 @@ class MetricsServer:
             log = get_dagster_logger()
             log.error(f"Failed to start Prometheus metrics server: {e}")
 
-    def _run_server(self):
-        """Run the Prometheus HTTP server."""
-        try:
-            start_http_server(self.port)
-            # Keep thread alive
-            while True:
-                time.sleep(60)
-                # Update daemon heartbeat
-                dagster_daemon_heartbeat.set(1)
-        except Exception as e:
-            log = get_dagster_logger()
-            log.error(f"Prometheus metrics server error: {e}")
-
 
 # Global metrics server instance
 _metrics_server = None
@@ -140,26 +126,33 @@ class JobMetricsContext:
     def __init__(self, job_name: str):
         self.job_name = job_name
         self.start_time = None
+        # Bind the label children once; .labels() does a dict lookup and
+        # tuple build on each call, and the bound children live at module
+        # scope inside the metrics themselves
+        self._total = dagster_job_total.labels(job_name=job_name)
+        self._success = dagster_job_success_total.labels(job_name=job_name)
+        self._failure = dagster_job_failure_total.labels(job_name=job_name)
+        self._duration = dagster_run_duration_seconds.labels(job_name=job_name)
 
     def __enter__(self):
         """Start tracking job execution."""
         self.start_time = time.time()
-        dagster_job_total.labels(job_name=self.job_name).inc()
+        self._total.inc()
         dagster_jobs_running.inc()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Record job completion metrics."""
         duration = time.time() - self.start_time
-        dagster_run_duration_seconds.labels(job_name=self.job_name).observe(duration)
+        self._duration.observe(duration)
         dagster_jobs_running.dec()
 
         if exc_type is None:
             # Success
-            dagster_job_success_total.labels(job_name=self.job_name).inc()
+            self._success.inc()
         else:
             # Failure
-            dagster_job_failure_total.labels(job_name=self.job_name).inc()
+            self._failure.inc()
 
         return False  # Don't suppress exceptions
 
@@ -170,54 +163,102 @@ class StepMetricsContext:
     def __init__(self, job_name: str, step_name: str):
         self.job_name = job_name
         self.step_name = step_name
+        # Pre-bound children, mirroring JobMetricsContext
+        self._total = dagster_step_total.labels(job_name=job_name, step_name=step_name)
+        self._success = dagster_step_success_total.labels(job_name=job_name, step_name=step_name)
+        self._failure = dagster_step_failure_total.labels(job_name=job_name, step_name=step_name)
 
     def __enter__(self):
         """Start tracking step execution."""
-        dagster_step_total.labels(
-            job_name=self.job_name,
-            step_name=self.step_name
-        ).inc()
+        self._total.inc()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Record step completion metrics."""
         if exc_type is None:
             # Success
-            dagster_step_success_total.labels(
-                job_name=self.job_name,
-                step_name=self.step_name
-            ).inc()
+            self._success.inc()
         else:
             # Failure
-            dagster_step_failure_total.labels(
-                job_name=self.job_name,
-                step_name=self.step_name
-            ).inc()
+            self._failure.inc()
 
         return False  # Don't suppress exceptions
 
 
+# Push requests go through a bounded queue serviced by one daemon thread,
+# so Pushgateway latency never blocks a hook thread
+_push_queue = queue.Queue(maxsize=64)
+_push_worker_lock = threading.Lock()
+_push_worker_started = False
+
+
+def _push_worker():
+    """Consume queued push requests, collapsing bursts into one push."""
+    while True:
+        job_name = _push_queue.get()
+        # Drain any burst: the whole registry is pushed each time, so one
+        # push covers every job queued so far
+        try:
+            while True:
+                job_name = _push_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+        for attempt in (1, 2):
+            try:
+                # Single grouping key: job_name is already a metric label,
+                # and a per-job grouping key would accumulate one metric
+                # group per job on the Pushgateway
+                push_to_gateway(
+                    gateway=PUSHGATEWAY_URL,
+                    job='dagster',
+                    registry=REGISTRY,
+                    timeout=5
+                )
+                log = get_dagster_logger()
+                log.info(f"Pushed metrics to Pushgateway (latest job: {job_name})")
+                break
+            except Exception as e:
+                if attempt == 2:
+                    log = get_dagster_logger()
+                    log.warning(f"Failed to push metrics to Pushgateway: {e}")
+                else:
+                    time.sleep(1)
+
+
+def _ensure_push_worker():
+    """Start the Pushgateway consumer thread on first use."""
+    global _push_worker_started
+    with _push_worker_lock:
+        if not _push_worker_started:
+            threading.Thread(
+                target=_push_worker,
+                daemon=True,
+                name="PushgatewayWorker"
+            ).start()
+            _push_worker_started = True
+
+
 def push_metrics_to_gateway(job_name: str):
-    """Push current metrics to Pushgateway for persistence."""
+    """Queue a metrics push to the Pushgateway without blocking the caller."""
     if not PUSHGATEWAY_ENABLED:
         return
 
+    _ensure_push_worker()
     try:
-        # Push metrics with job-specific grouping key
-        push_to_gateway(
-            gateway=PUSHGATEWAY_URL,
-            job=f'dagster-{job_name}',
-            registry=REGISTRY
-        )
-        log = get_dagster_logger()
-        log.info(f"Pushed metrics to Pushgateway for job {job_name}")
-    except Exception as e:
-        log = get_dagster_logger()
-        log.warning(f"Failed to push metrics to Pushgateway: {e}")
+        _push_queue.put_nowait(job_name)
+    except queue.Full:
+        # A push is already pending and will carry these samples too
+        pass
 
 
 # Dagster hooks for job-level metrics
-_job_start_times = {}
+# Start times for in-flight runs, keyed by run_id. TTL-bounded so runs that
+# crash without firing a hook expire instead of leaking; the lock guards
+# access from hook threads. run_id itself never becomes a metric label
+# (it is unbounded).
+_job_start_times = TTLCache(maxsize=1024, ttl=7200)
+_job_start_times_lock = threading.Lock()
 
 
 @success_hook
@@ -231,10 +272,11 @@ def job_success_hook(context: HookContext):
     dagster_job_total.labels(job_name=job_name).inc()
 
     # Track duration if start time was recorded
-    if run_id in _job_start_times:
-        duration = time.time() - _job_start_times[run_id]
+    with _job_start_times_lock:
+        start_time = _job_start_times.pop(run_id, None)
+    if start_time is not None:
+        duration = time.time() - start_time
         dagster_run_duration_seconds.labels(job_name=job_name).observe(duration)
-        del _job_start_times[run_id]
 
     log = get_dagster_logger()
     log.info(f"Metrics: Job {job_name} completed successfully (run_id={run_id})")
@@ -254,10 +296,11 @@ def job_failure_hook(context: HookContext):
     dagster_job_total.labels(job_name=job_name).inc()
 
     # Track duration if start time was recorded
-    if run_id in _job_start_times:
-        duration = time.time() - _job_start_times[run_id]
+    with _job_start_times_lock:
+        start_time = _job_start_times.pop(run_id, None)
+    if start_time is not None:
+        duration = time.time() - start_time
         dagster_run_duration_seconds.labels(job_name=job_name).observe(duration)
-        del _job_start_times[run_id]
 
     log = get_dagster_logger()
     log.error(f"Metrics: Job {job_name} failed (run_id={run_id})")
@@ -1,9 +1,21 @@
-import os, json, time, hashlib
+import os, time, threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from typing import List, Dict, Any
 from pathlib import Path
 
-import boto3, requests
+import boto3, httpx, orjson, xxhash
+# Aliased: the dagster import below re-binds the name Config
+from botocore.config import Config as BotoConfig
+from dotenv import dotenv_values
+
+# pyarrow backs the columnar transform path for large coord batches; the
+# scalar path covers deployments without it
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
 from dagster import op, job, get_dagster_logger, Config, ScheduleDefinition, Definitions, repository
 
 # Import metrics instrumentation
@@ -22,19 +34,62 @@ def load_env_file(env_file_path: str = "/secrets/.env"):
     """Load environment variables from vault-agent generated .env file"""
     env_path = Path(env_file_path)
     if env_path.exists():
-        with open(env_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#'):
-                    key, _, value = line.partition('=')
-                    if key and value:
-                        os.environ.setdefault(key.strip(), value.strip())
+        for key, value in dotenv_values(env_path).items():
+            if value:
+                os.environ.setdefault(key, value)
 
 # Load .env on module import
 load_env_file()
 
 OPENWEATHER_URL = "https://api.openweathermap.org/data/2.5/weather"
 
+# Shared HTTP/2 client: keep-alive connections avoid a TLS handshake per
+# city and multiplex concurrent requests over one connection
+_http = httpx.Client(
+    http2=True,
+    timeout=20,
+    limits=httpx.Limits(max_keepalive_connections=32),
+)
+
+
+class _TokenBucket:
+    """Token-bucket rate limiter honouring OpenWeather's 60 req/min cap."""
+
+    def __init__(self, rate: float = 1.0, burst: int = 60):
+        self.rate = rate  # tokens per second
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_rate_limiter = _TokenBucket()
+
+# One S3 client for the process: client construction loads endpoint and
+# region data and builds a fresh connection pool, so per-run clients paid
+# that cost on every upload
+_s3 = boto3.session.Session().client(
+    "s3",
+    config=BotoConfig(
+        max_pool_connections=64,
+        retries={"max_attempts": 3, "mode": "adaptive"},
+        tcp_keepalive=True,
+    ),
+)
+
 class FetchConfig(Config):
     coords: List[Dict[str, Any]] = [
         {"name": "Luxembourg", "lat": 49.6116, "lon": 6.1319},
@@ -71,48 +126,150 @@ def fetch_weather(_, config: FetchConfig) -> List[Dict[str, Any]]:
         if not api_key:
             raise RuntimeError("OPENWEATHER_API_KEY not set")
 
-        out = []
-        for c in config.coords:
-            r = requests.get(OPENWEATHER_URL, params={"lat": c["lat"], "lon": c["lon"], "appid": api_key, "units": config.units}, timeout=20)
+        def _fetch_one(c: Dict[str, Any]) -> Dict[str, Any]:
+            _rate_limiter.acquire()
+            r = _http.get(OPENWEATHER_URL, params={"lat": c["lat"], "lon": c["lon"], "appid": api_key, "units": config.units})
             r.raise_for_status()
             data = r.json()
             data["_meta"] = {"requested_name": c.get("name"), "requested_lat": c["lat"], "requested_lon": c["lon"]}
-            out.append(data)
-            time.sleep(0.2)
             default_name = f"{c['lat']},{c['lon']}"
             log.info(f"Fetched weather for {c.get('name', default_name)}")
-        return out
+            return data
+
+        # Fetches are I/O-bound, so run them concurrently; the token bucket
+        # keeps the aggregate rate inside the API quota
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            return list(pool.map(_fetch_one, config.coords))
+
+# Shared empty-dict sentinel: `or _EMPTY` on a missing section avoids
+# allocating a throwaway dict per miss the way `or {}` did
+_EMPTY: Dict[str, Any] = {}
+
+def _product(w: Dict[str, Any], ts: str) -> Dict[str, Any]:
+    """
+    Build one flat product record from a raw OpenWeather payload.
+
+    Keys are declared in sorted order so serialisation needs no per-record
+    key sort to stay deterministic.
+    """
+    main = w.get("main") or _EMPTY
+    wind = w.get("wind") or _EMPTY
+    sys = w.get("sys") or _EMPTY
+    coord = w.get("coord") or _EMPTY
+    meta = w.get("_meta")
+    weather = w.get("weather")
+    lat = coord.get("lat"); lon = coord.get("lon")
+    return {
+        "collected_at": ts,
+        "feels_like": main.get("feels_like"),
+        "humidity": main.get("humidity"),
+        "id": xxhash.xxh3_64_hexdigest(f"{lat},{lon},{w.get('dt')}".encode()),
+        "lat": lat,
+        "location_name": (meta.get("requested_name") if meta else None) or w.get("name"),
+        "lon": lon,
+        "pressure": main.get("pressure"),
+        "source": "openweathermap_current",
+        "sunrise": sys.get("sunrise"),
+        "sunset": sys.get("sunset"),
+        "temp": main.get("temp"),
+        "weather": weather[0].get("description") if weather else None,
+        "wind_deg": wind.get("deg"),
+        "wind_speed": wind.get("speed"),
+    }
+
+# Batches at least this large take the columnar path; below it the scalar
+# transform wins on Table construction overhead
+_COLUMNAR_THRESHOLD = 1000
+
+def _transform_columnar(raw: List[Dict[str, Any]], ts: str) -> List[Dict[str, Any]]:
+    """
+    Columnar variant of the transform for large coord batches.
+
+    Arrow stores each column contiguously instead of ~250 bytes of dict
+    overhead per record, and the struct kernels extract nested fields in C.
+    """
+    tbl = pa.Table.from_pylist(raw)
+    n = len(tbl)
+    names = set(tbl.column_names)
+
+    def _field(col: str, name: str):
+        if col not in names:
+            return pa.nulls(n)
+        column = tbl[col]
+        # OpenWeather omits optional children (e.g. wind.deg) entirely on
+        # some records; struct_field raises when the child is absent from
+        # the inferred schema, so map that to a null column like the
+        # scalar path's .get() would
+        if not pa.types.is_struct(column.type) or column.type.get_field_index(name) < 0:
+            return pa.nulls(n)
+        return pc.struct_field(column, name)
+
+    lat = _field("coord", "lat")
+    lon = _field("coord", "lon")
+    meta_name = _field("_meta", "requested_name")
+    location = pc.coalesce(meta_name, tbl["name"]) if "name" in names else meta_name
+    if "weather" in names:
+        # list_element raises on empty lists, so take the first entry
+        # record-wise; empty or null lists become None
+        weather = pa.array([
+            (entries[0] or _EMPTY).get("description") if entries else None
+            for entries in tbl["weather"].to_pylist()
+        ])
+    else:
+        weather = pa.nulls(n)
+    dt = tbl["dt"] if "dt" in names else pa.nulls(n)
+
+    # Ids depend on a per-record hash, so they are computed scalar-wise
+    ids = pa.array([
+        xxhash.xxh3_64_hexdigest(f"{la},{lo},{d}".encode())
+        for la, lo, d in zip(lat.to_pylist(), lon.to_pylist(), dt.to_pylist())
+    ])
+
+    # Columns are declared in sorted key order, matching _product, so the
+    # emitted dicts need no key sort at serialisation time
+    return pa.table({
+        "collected_at": pa.array([ts] * n),
+        "feels_like": _field("main", "feels_like"),
+        "humidity": _field("main", "humidity"),
+        "id": ids,
+        "lat": lat,
+        "location_name": location,
+        "lon": lon,
+        "pressure": _field("main", "pressure"),
+        "source": pa.array(["openweathermap_current"] * n),
+        "sunrise": _field("sys", "sunrise"),
+        "sunset": _field("sys", "sunset"),
+        "temp": _field("main", "temp"),
+        "weather": weather,
+        "wind_deg": _field("wind", "deg"),
+        "wind_speed": _field("wind", "speed"),
+    }).to_pylist()
 
 @op
 def transform_weather(_, raw: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     with StepMetricsContext(job_name="weather_product_job", step_name="transform_weather"):
         ts = datetime.now(timezone.utc).isoformat()
-        products = []
-        for w in raw:
-            main = w.get("main", {}); wind = w.get("wind", {}); sys = w.get("sys", {})
-            name = (w.get("_meta") or {}).get("requested_name") or w.get("name")
-            lat = (w.get("coord") or {}).get("lat"); lon = (w.get("coord") or {}).get("lon")
-            products.append({
-                "id": hashlib.sha1(f"{lat},{lon},{w.get('dt')}".encode()).hexdigest()[:16],
-                "collected_at": ts, "location_name": name, "lat": lat, "lon": lon,
-                "temp": main.get("temp"), "feels_like": main.get("feels_like"),
-                "humidity": main.get("humidity"), "pressure": main.get("pressure"),
-                "wind_speed": wind.get("speed"), "wind_deg": wind.get("deg"),
-                "weather": (w.get("weather") or [{}])[0].get("description"),
-                "sunrise": sys.get("sunrise"), "sunset": sys.get("sunset"),
-                "source": "openweathermap_current",
-            })
-        return products
+        if pa is not None and len(raw) >= _COLUMNAR_THRESHOLD:
+            try:
+                return _transform_columnar(raw, ts)
+            except pa.ArrowInvalid as e:
+                # A payload shape Arrow cannot ingest must not fail the
+                # whole batch; the scalar path handles it field by field
+                get_dagster_logger().warning(f"Columnar transform failed, using scalar path: {e}")
+        return [_product(w, ts) for w in raw]
 
 @op
 def upload_to_s3(_, config: S3Config, products: List[Dict[str, Any]]) -> str:
     with StepMetricsContext(job_name="weather_product_job", step_name="upload_to_s3"):
         if not products: return ""
-        s3 = boto3.client("s3")
-        now = datetime.utcnow()
-        key = f"{config.prefix}{now:%Y/%m/%d}/{now:%H%M%S}.jsonl"
-        body = "\n".join(json.dumps(p, separators=(",", ":"), sort_keys=True) for p in products)
-        s3.put_object(Bucket=config.bucket, Key=key, Body=body.encode("utf-8"), ContentType="application/json")
+        # Single strftime pass; datetime.utcnow() is deprecated since 3.12
+        now = datetime.now(timezone.utc)
+        key = f"{config.prefix}{now:%Y/%m/%d/%H%M%S}.jsonl"
+        # orjson emits compact bytes directly, so no per-record str
+        # allocation or final encode pass; key order is deterministic
+        # because the transform builds the dicts already sorted
+        body = b"\n".join(orjson.dumps(p) for p in products)
+        _s3.put_object(Bucket=config.bucket, Key=key, Body=body, ContentType="application/json")
         return f"s3://{config.bucket}/{key}"
 
 @job(hooks={job_success_hook, job_failure_hook})